@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+
+def _factor_after(ratios: np.ndarray) -> np.ndarray:
+    # Product of the ratios strictly after each row (rows are in ascending date order)
+    reverse_cumprod = np.cumprod(ratios[::-1])[::-1]
+    return reverse_cumprod / ratios
+
+
+def _split_factors(data: pd.DataFrame) -> np.ndarray:
+    if 'Stock Splits' not in data.columns:
+        return np.ones(len(data))
+    ratios = pd.to_numeric(data['Stock Splits'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    ratios = np.where(ratios == 0, 1.0, ratios)
+    return _factor_after(ratios)
+
+
+def _dividend_factors(data: pd.DataFrame) -> np.ndarray:
+    if 'Dividends' not in data.columns:
+        return np.ones(len(data))
+    dividends = pd.to_numeric(data['Dividends'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    previous_close = pd.to_numeric(data['Close'], errors='coerce').shift(1).to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = 1.0 - dividends / previous_close
+    ratios = np.where((dividends == 0) | ~np.isfinite(ratios) | (ratios <= 0), 1.0, ratios)
+    return _factor_after(ratios)
+
+
+def _scale(data: pd.DataFrame, split_factors: np.ndarray, dividend_factors: np.ndarray) -> pd.DataFrame:
+    data = data.copy()
+    price_factors = split_factors * dividend_factors
+    for column in PRICE_COLUMNS:
+        if column in data.columns:
+            data[column] = pd.to_numeric(data[column], errors='coerce') * price_factors
+    if 'Volume' in data.columns:
+        data['Volume'] = pd.to_numeric(data['Volume'], errors='coerce') / split_factors
+    if 'Dividends' in data.columns:
+        data['Dividends'] = pd.to_numeric(data['Dividends'], errors='coerce') * split_factors
+    return data
+
+
+def _by_ticker(data: pd.DataFrame, func) -> pd.DataFrame:
+    if data.empty:
+        return data
+    if 'Date' in data.columns:
+        data = data.sort_values('Date', kind='stable')
+    if 'Ticker' in data.columns and data['Ticker'].nunique() > 1:
+        return pd.concat([func(ticker_data) for _, ticker_data in data.groupby('Ticker', sort=False)])
+    return func(data)
+
+
+def remove_split_adjustment(data: pd.DataFrame) -> pd.DataFrame:
+    """Restore raw prices from a split-adjusted yfinance history
+    (auto_adjust=False still returns prices, volumes and dividends adjusted
+    for every split after each row). Only the splits inside the fetched window
+    can affect it, so an incremental fetch is de-adjusted exactly.
+    :return: DataFrame with raw Open/High/Low/Close/Volume/Dividends
+    """
+    def _remove(ticker_data):
+        return _scale(ticker_data, _split_factors(ticker_data), np.ones(len(ticker_data)))
+    return _by_ticker(data, _remove)
+
+
+def adjust_prices(data: pd.DataFrame, dividends: bool=True) -> pd.DataFrame:
+    """Back-adjust raw prices using the 'Stock Splits' and 'Dividends' actions
+    stored alongside them, so corporate actions never require a refetch.
+    :return: DataFrame with split (and optionally dividend) adjusted prices
+    """
+    def _adjust(ticker_data):
+        split_factors = _split_factors(ticker_data)
+        dividend_factors = _dividend_factors(ticker_data) if dividends else np.ones(len(ticker_data))
+        return _scale(ticker_data, 1.0 / split_factors, dividend_factors)
+    return _by_ticker(data, _adjust)
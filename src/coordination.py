@@ -0,0 +1,266 @@
+from abc import ABC, abstractmethod
+import json
+import sqlite3
+import time
+import zlib
+
+from botocore.exceptions import ClientError
+from s3_base import S3BaseClass
+
+
+#####################################################################
+# Lease Stores
+#####################################################################
+
+class LeaseStore(ABC):
+    """Shared store through which several ingestion workers claim tickers.
+    Each ticker holds an owner, a lease expiration (epoch seconds) and the
+    merged checkpoint date of its latest ingestion.
+    """
+
+    @abstractmethod
+    def register(self, tickers: list) -> None:
+        pass
+
+    @abstractmethod
+    def claim(self, worker_id: str, tickers: list, lease_seconds: float, current_date: str):
+        """Lease one ticker that is unowned (or whose lease expired) and was
+        not ingested on current_date yet.
+        :return: (ticker, checkpoint) tuple, or None when there is nothing left
+        """
+        pass
+
+    @abstractmethod
+    def renew(self, worker_id: str, tickers: list, lease_seconds: float) -> list:
+        """Extend the leases still owned by worker_id
+        :return: the tickers whose lease was renewed
+        """
+        pass
+
+    @abstractmethod
+    def release(self, worker_id: str, ticker: str, checkpoint: str=None) -> None:
+        pass
+
+    @abstractmethod
+    def reset(self, tickers: list) -> None:
+        """Clear the checkpoints of tickers so they are ingested from scratch
+        (checkpoints are otherwise only ever merged forward)
+        """
+        pass
+
+    @abstractmethod
+    def get_checkpoints(self) -> dict:
+        pass
+
+    @staticmethod
+    def _merge_checkpoint(current: str, new: str) -> str:
+        candidates = [date for date in [current, new] if date is not None]
+        return max(candidates) if candidates else None
+
+
+class SqliteLeaseStore(LeaseStore):
+
+    def __init__(self, database_path: str, timeout: float=30.0) -> None:
+        self.database_path = database_path
+        self.timeout = timeout
+        self._wanted_tickers, self._wanted = None, set()
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS leases ("
+                         "ticker TEXT PRIMARY KEY, owner TEXT, expires_at REAL, checkpoint TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS leases_checkpoint ON leases (checkpoint)")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per operation keeps the store usable from the heartbeat thread
+        return sqlite3.connect(self.database_path, timeout=self.timeout, isolation_level=None)
+
+    def register(self, tickers: list) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT OR IGNORE INTO leases (ticker) VALUES (?)", [(tick,) for tick in tickers])
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def claim(self, worker_id: str, tickers: list, lease_seconds: float, current_date: str):
+        now = time.time()
+        if tickers is not self._wanted_tickers:
+            self._wanted_tickers, self._wanted = tickers, set(tickers)
+        claimed = None
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Only pending rows are walked through the checkpoint index, so a claim
+            # skips at most the rows leased by other workers, whatever the progress
+            pending = conn.execute("SELECT ticker, checkpoint FROM leases WHERE checkpoint IS NULL AND (owner IS NULL OR expires_at < ?) "
+                                   "UNION ALL "
+                                   "SELECT ticker, checkpoint FROM leases WHERE checkpoint < ? AND (owner IS NULL OR expires_at < ?)",
+                                   (now, current_date, now))
+            claimed = next((row for row in pending if row[0] in self._wanted), None)
+            pending.close()
+            if claimed is not None:
+                conn.execute("UPDATE leases SET owner = ?, expires_at = ? WHERE ticker = ?",
+                             (worker_id, now + lease_seconds, claimed[0]))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return claimed
+
+    def renew(self, worker_id: str, tickers: list, lease_seconds: float) -> list:
+        renewed = []
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for ticker in tickers:
+                cursor = conn.execute("UPDATE leases SET expires_at = ? WHERE ticker = ? AND owner = ?",
+                                      (time.time() + lease_seconds, ticker, worker_id))
+                if cursor.rowcount > 0:
+                    renewed.append(ticker)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return renewed
+
+    def release(self, worker_id: str, ticker: str, checkpoint: str=None) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT checkpoint FROM leases WHERE ticker = ?", (ticker,)).fetchone()
+            merged_checkpoint = self._merge_checkpoint(row[0] if row else None, checkpoint)
+            conn.execute("UPDATE leases SET checkpoint = ? WHERE ticker = ?", (merged_checkpoint, ticker))
+            conn.execute("UPDATE leases SET owner = NULL, expires_at = NULL WHERE ticker = ? AND owner = ?",
+                         (ticker, worker_id))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def reset(self, tickers: list) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE leases SET checkpoint = NULL WHERE ticker = ?", [(tick,) for tick in tickers])
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def get_checkpoints(self) -> dict:
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT ticker, checkpoint FROM leases").fetchall()
+        finally:
+            conn.close()
+        return {ticker: checkpoint for ticker, checkpoint in rows}
+
+
+class S3LeaseStore(LeaseStore, S3BaseClass):
+    """One JSON object per ticker under '<prefix>/'. Every update is a
+    conditional write (If-Match on the ETag read, If-None-Match on creation),
+    so concurrent workers can never both win the same lease. Each worker scans
+    the tickers from its own offset and remembers the ones it found ingested
+    or leased, so draining a universe costs a linear number of requests.
+    """
+
+    def __init__(self, client, bucket_name, prefix: str="leases") -> None:
+        S3BaseClass.__init__(self, client=client, bucket_name=bucket_name)
+        self.prefix = prefix
+        self._ingested = {}
+        self._leased_until = {}
+        if not self.check_if_bucket_exists():
+            self.create_s3_bucket()
+
+    def _object_key(self, ticker) -> str:
+        return f"{self.prefix}/{ticker}.json"
+
+    @staticmethod
+    def _is_conflict(error: ClientError) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409")
+
+    def _get_lease(self, ticker):
+        response = self.client.get_object(Bucket=self.bucket_name, Key=self._object_key(ticker))
+        return json.loads(response["Body"].read()), response["ETag"]
+
+    def _put_lease(self, ticker, lease: dict, etag: str=None) -> bool:
+        condition = {"IfMatch": etag} if etag is not None else {"IfNoneMatch": "*"}
+        try:
+            self.client.put_object(Bucket=self.bucket_name, Key=self._object_key(ticker), Body=json.dumps(lease), **condition)
+        except ClientError as e:
+            if self._is_conflict(e):
+                return False
+            raise
+        return True
+
+    def register(self, tickers: list) -> None:
+        for ticker in tickers:
+            self._put_lease(ticker, {"owner": None, "expires_at": None, "checkpoint": None})
+
+    def _is_skippable(self, ticker, current_date, now) -> bool:
+        ingested = self._ingested.get(ticker)
+        return (ingested is not None and ingested >= current_date) or self._leased_until.get(ticker, 0) > now
+
+    def claim(self, worker_id: str, tickers: list, lease_seconds: float, current_date: str):
+        ordered = sorted(tickers)
+        if not ordered:
+            return None
+        offset = zlib.crc32(worker_id.encode()) % len(ordered)
+        for ticker in ordered[offset:] + ordered[:offset]:
+            now = time.time()
+            if self._is_skippable(ticker, current_date, now):
+                continue
+            lease, etag = self._get_lease(ticker)
+            if lease["checkpoint"] is not None and lease["checkpoint"] >= current_date:
+                self._ingested[ticker] = lease["checkpoint"]
+                continue
+            if lease["owner"] is not None and lease["expires_at"] >= now:
+                self._leased_until[ticker] = lease["expires_at"]
+                continue
+            new_lease = {**lease, "owner": worker_id, "expires_at": now + lease_seconds}
+            if self._put_lease(ticker, new_lease, etag):
+                return ticker, lease["checkpoint"]
+            self._leased_until[ticker] = now + lease_seconds
+        return None
+
+    def renew(self, worker_id: str, tickers: list, lease_seconds: float) -> list:
+        renewed = []
+        for ticker in tickers:
+            # A lost conditional write may come from this worker's own concurrent
+            # renewal, so the lease is only given up once another owner is seen
+            while True:
+                lease, etag = self._get_lease(ticker)
+                if lease["owner"] != worker_id:
+                    break
+                new_lease = {**lease, "expires_at": time.time() + lease_seconds}
+                if self._put_lease(ticker, new_lease, etag):
+                    renewed.append(ticker)
+                    break
+        return renewed
+
+    def release(self, worker_id: str, ticker: str, checkpoint: str=None) -> None:
+        while True:
+            lease, etag = self._get_lease(ticker)
+            new_lease = {**lease, "checkpoint": self._merge_checkpoint(lease["checkpoint"], checkpoint)}
+            if lease["owner"] == worker_id:
+                new_lease = {**new_lease, "owner": None, "expires_at": None}
+            if self._put_lease(ticker, new_lease, etag):
+                self._ingested[ticker] = new_lease["checkpoint"]
+                return
+
+    def reset(self, tickers: list) -> None:
+        for ticker in tickers:
+            while True:
+                lease, etag = self._get_lease(ticker)
+                if self._put_lease(ticker, {**lease, "checkpoint": None}, etag):
+                    self._ingested.pop(ticker, None)
+                    break
+
+    def get_checkpoints(self) -> dict:
+        checkpoints = {}
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=f"{self.prefix}/"):
+            for content in page.get("Contents", []):
+                ticker = content["Key"][len(self.prefix) + 1:-len(".json")]
+                lease, _ = self._get_lease(ticker)
+                checkpoints[ticker] = lease["checkpoint"]
+        return checkpoints
@@ -9,9 +9,12 @@ import yfinance as yf
 import pandas as pd
  
 from writers import DataWriter, S3Writer
+from adjustments import remove_split_adjustment
  
 import logging
+import socket
 import sys
+import threading
 
 from dotenv import load_dotenv
 import boto3 
@@ -29,7 +32,7 @@ logging.basicConfig(
 
 class DataIngestor(ABC):
 
-    def __init__(self, writer, ticker: list, batch_ingest: bool, interval: str, period: str=None, ticker_group: str="Undefined", start: datetime=None, end: datetime=None, prepost: bool=False, auto_adjust: bool=True, actions: bool=True, default_start_time: datetime=datetime.date(1800, 1, 1)) -> None:
+    def __init__(self, writer, ticker: list, batch_ingest: bool, interval: str, period: str=None, ticker_group: str="Undefined", start: datetime=None, end: datetime=None, prepost: bool=False, auto_adjust: bool=False, actions: bool=True, default_start_time: datetime=datetime.date(1800, 1, 1)) -> None:
         self.default_start_date = None
         self.ticker = ticker
         self.ticker_group = ticker_group
@@ -48,16 +51,45 @@ class DataIngestor(ABC):
     def _checkpoint_filename(self) -> str:
         return f"checkpoints/{self.__class__.__name__}.checkpoint"
  
+    @property
+    def _adjustment_mode_filename(self) -> str:
+        return f"checkpoints/{self.__class__.__name__}.mode"
+
+    @property
+    def _adjustment_mode(self) -> str:
+        return "adjusted" if self.auto_adjust else "raw"
+
     def _write_checkpoint(self) -> None:
         if not os.path.exists("./checkpoints"):
             os.mkdir("./checkpoints")
         with open(self._checkpoint_filename, "w") as f:
             json.dump(self._checkpoint, f)
+        with open(self._adjustment_mode_filename, "w") as f:
+            json.dump({"mode": self._adjustment_mode}, f)
+
+    def _load_adjustment_mode(self) -> str:
+        try:
+            with open(self._adjustment_mode_filename, "r") as f:
+                return json.load(f)["mode"]
+        except FileNotFoundError:
+            # Checkpoints written before the mode was recorded hold adjusted prices
+            return "adjusted"
+
+    def _check_adjustment_mode(self, checkpoint) -> dict:
+        # Raw and adjusted rows must never be mixed in one curated history,
+        # so a change of mode forces a full refetch of every ticker
+        stored_mode = self._load_adjustment_mode()
+        if stored_mode != self._adjustment_mode and any(date is not None for date in checkpoint.values()):
+            logger.warning(f"Checkpoint '{self._checkpoint_filename}' was ingested with {stored_mode} prices, "
+                           f"but {self._adjustment_mode} prices are requested. Resetting it to refetch the entire history.")
+            checkpoint = {tick: None for tick in checkpoint}
+        return checkpoint
  
     def _load_checkpoint(self) -> dict:
         try:
             with open(self._checkpoint_filename, "r") as f:
                 checkpoint = json.load(f)
+            checkpoint = self._check_adjustment_mode(checkpoint)
             same_ingestion_flag = self._check_if_ingesting_new_ticker(checkpoint)
             if same_ingestion_flag is False:
                 checkpoint = self._append_checkpoint(checkpoint)
@@ -77,6 +109,14 @@ class DataIngestor(ABC):
         new_checkpoint = {**checkpoint, **outer_join_dict}
         return new_checkpoint
 
+    def reset_checkpoint(self) -> None:
+        """Forget every ingestion date so the next run refetches the entire
+        history, e.g. to replace a history ingested with auto_adjust=True by
+        raw prices before reading it with adjust_for_actions.
+        """
+        self._checkpoint = {tick: None for tick in self._checkpoint}
+        self._write_checkpoint()
+
     def _update_checkpoint(self, key, value) -> None:
         self._checkpoint[str(key)] = value
         self._write_checkpoint()
@@ -139,17 +179,138 @@ class TickerDataIngestor(DataIngestor):
             for k, v in batched_checkpoint_keys_values:
                 self._update_checkpoint(k, v)
 
+    @property
+    def _request_actions(self) -> bool:
+        # Raw prices can only be restored (and adjusted again at read time)
+        # from the 'Dividends'/'Stock Splits' actions, so they are always requested
+        return self.actions or not self.auto_adjust
+
+    def _to_raw_prices(self, data_df) -> pd.DataFrame:
+        # Raw prices stay valid after later corporate actions, so incremental
+        # ingestions never conflict with the curated history. Adjustment is
+        # applied at read time from the stored 'Dividends'/'Stock Splits'.
+        if self.auto_adjust:
+            return data_df
+        data_df = remove_split_adjustment(data_df)
+        data_df = data_df.drop(columns=['Adj Close'], errors='ignore')
+        if not self.actions:
+            data_df = data_df.drop(columns=['Dividends', 'Stock Splits'], errors='ignore')
+        return data_df
+
     def get_data_starting_from_date(self, api, start, ticker) -> pd.DataFrame:
-        data_df = api.history(start=start, interval=self.interval, prepost=self.prepost, actions=self.actions, auto_adjust=self.auto_adjust)
+        data_df = api.history(start=start, interval=self.interval, prepost=self.prepost, actions=self._request_actions, auto_adjust=self.auto_adjust)
+        data_df = self._to_raw_prices(data_df)
         data_df['Ticker'] = ticker.upper()
         return data_df
 
     def get_entire_history_data(self, api, ticker) -> pd.DataFrame:
-        data_df = api.history(period="max", interval=self.interval, prepost=self.prepost, actions=self.actions, auto_adjust=self.auto_adjust)
+        data_df = api.history(period="max", interval=self.interval, prepost=self.prepost, actions=self._request_actions, auto_adjust=self.auto_adjust)
+        data_df = self._to_raw_prices(data_df)
         data_df['Ticker'] = ticker.upper()
         return data_df
 
 
+class ShardedTickerDataIngestor(TickerDataIngestor):
+    """Ingests a ticker universe cooperatively with other workers. Tickers are
+    claimed one at a time from a shared LeaseStore, leases are kept alive by a
+    heartbeat thread, and checkpoints are merged into the store on release.
+    The store is the only checkpoint; no local checkpoint file is written.
+    A ticker whose lease was lost is neither written nor checkpointed.
+    """
+
+    def __init__(self, writer, ticker: list, batch_ingest: bool, interval: str, lease_store, worker_id: str=None, lease_seconds: float=300, **kwargs) -> None:
+        self.lease_store = lease_store
+        self.worker_id = worker_id if worker_id is not None else f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self._held_leases = set()
+        self._lost_leases = set()
+        self._held_leases_lock = threading.Lock()
+        self.lease_store.register(ticker)
+        super().__init__(writer, ticker, batch_ingest, interval, **kwargs)
+
+    def _load_checkpoint(self) -> dict:
+        shared_checkpoint = self.lease_store.get_checkpoints()
+        return {tick: shared_checkpoint.get(tick) for tick in self.ticker}
+
+    def _write_checkpoint(self) -> None:
+        pass
+
+    def reset_checkpoint(self) -> None:
+        self.lease_store.reset(self.ticker)
+        self._checkpoint = {tick: None for tick in self.ticker}
+
+    def _mark_lost(self, tickers) -> None:
+        if tickers:
+            logger.info(f"Worker '{self.worker_id}' lost the leases of {sorted(tickers)}")
+            with self._held_leases_lock:
+                self._lost_leases.update(tickers)
+
+    def _renew(self, tickers) -> list:
+        renewed = self.lease_store.renew(self.worker_id, tickers, self.lease_seconds)
+        self._mark_lost(set(tickers) - set(renewed))
+        with self._held_leases_lock:
+            return [tick for tick in renewed if tick not in self._lost_leases]
+
+    def _heartbeat(self, stop_event) -> None:
+        while not stop_event.wait(self.lease_seconds / 3):
+            with self._held_leases_lock:
+                held_leases = list(self._held_leases - self._lost_leases)
+            try:
+                self._renew(held_leases)
+            except Exception as e:
+                logger.info(f"An exception occured while renewing the leases of worker '{self.worker_id}': {e}")
+
+    def _release(self, ticker, checkpoint=None) -> None:
+        self.lease_store.release(self.worker_id, ticker, checkpoint)
+        with self._held_leases_lock:
+            self._held_leases.discard(ticker)
+
+    def ingest(self) -> None:
+        batched_data, batched_checkpoint_keys_values = [], []
+        stop_event = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(stop_event,), daemon=True)
+        heartbeat.start()
+        try:
+            while True:
+                current_date = datetime.date.today().strftime("%Y-%m-%d")
+                lease = self.lease_store.claim(self.worker_id, self.ticker, self.lease_seconds, current_date)
+                if lease is None:
+                    break
+                ticker, latest_date = lease
+                with self._held_leases_lock:
+                    self._held_leases.add(ticker)
+                    self._lost_leases.discard(ticker)
+                api = yf.Ticker(ticker)
+                data_df = self.get_data(api, ticker, latest_date, current_date)
+
+                if self.batch_ingest is not True:
+                    # Renewed right before writing so a lease lost since the last heartbeat is caught too
+                    if self._renew([ticker]):
+                        self.writer.write(data_df, ticker, self.ticker_group)
+                        self._update_checkpoint(ticker, current_date)
+                        self._release(ticker, current_date)
+                    else:
+                        logger.info(f"Skipping ticker '{ticker}' whose lease was lost by worker '{self.worker_id}'")
+                        self._release(ticker)
+                else:
+                    batched_data.append(data_df)
+                    batched_checkpoint_keys_values.append((ticker, current_date))
+
+            if self.batch_ingest and batched_data:
+                renewed = set(self._renew([k for k, _ in batched_checkpoint_keys_values]))
+                kept = [(data, (k, v)) for data, (k, v) in zip(batched_data, batched_checkpoint_keys_values) if k in renewed]
+                if kept:
+                    self.writer.batch_write([data for data, _ in kept], "batch", self.ticker_group)
+                for _, (k, v) in kept:
+                    self._update_checkpoint(k, v)
+                    self._release(k, v)
+        finally:
+            stop_event.set()
+            heartbeat.join()
+            for ticker in list(self._held_leases):
+                self._release(ticker)
+
+
 if __name__=="__main__":
 
     load_dotenv('/home/user/.env')
@@ -1,21 +1,177 @@
 from abc import ABC, abstractmethod 
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import tempfile
+import numpy as np
 import pandas as pd
 import os 
 
 from models import get_engine
 from s3_base import S3BaseClass 
+from adjustments import adjust_prices
+
+logger = logging.getLogger(__name__)
  
 
+PANEL_FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits']
+
+
+#####################################################################
+# Cross-Ticker Panel Reader
+#####################################################################
+
+def _to_naive_dates(dates: pd.Series) -> np.ndarray:
+    # Keep the exchange wall-clock time so tickers of one market align on the same rows
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        # UTC offsets change with daylight saving time, so they are dropped before parsing
+        dates = pd.to_datetime(dates.astype(str).str.replace(r'([+-]\d{2}:\d{2}|Z)$', '', regex=True))
+    elif dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates.to_numpy(dtype='datetime64[ns]')
+
+
+def _to_naive_bound(value) -> np.datetime64:
+    # Bounds are compared against exchange wall-clock dates, so a timezone is dropped, not converted
+    bound = pd.Timestamp(value)
+    if bound.tzinfo is not None:
+        bound = bound.tz_localize(None)
+    return np.datetime64(bound, 'ns')
+
+
+class PanelReaderMixin(ABC):
+    """Subclasses provide the curated files of a ticker (oldest first) through
+    _panel_files, how to read one of them through _read_panel_file, and what
+    identifies the data source and a file version for the panel cache.
+    """
+
+    @abstractmethod
+    def _panel_source(self) -> list:
+        pass
+
+    @abstractmethod
+    def _panel_files(self, ticker: str, ticker_group: str) -> list:
+        pass
+
+    @abstractmethod
+    def _panel_file_version(self, path: str) -> str:
+        pass
+
+    @abstractmethod
+    def _read_panel_file(self, path: str) -> pd.DataFrame:
+        pass
+
+    def _read_panel_ticker(self, newest_files: list) -> pd.DataFrame:
+        if not newest_files:
+            return pd.DataFrame(columns=['Date'])
+        curated_data = self._read_panel_file(newest_files[-1])
+        if 'Date' not in curated_data.columns:
+            curated_data = curated_data.reset_index()
+        if self.adjust_for_actions:
+            curated_data = adjust_prices(curated_data)
+        return curated_data
+
+    def _panel_cache_filename(self, cache_path, tickers, ticker_group, start, end, fields, newest_files) -> str:
+        versions = [[self._panel_file_version(path) for path in paths] for paths in newest_files]
+        query = json.dumps([self._panel_source(), list(tickers), ticker_group, str(start), str(end), list(fields), self.adjust_for_actions, versions])
+        return f"{cache_path}/panel-{hashlib.sha256(query.encode()).hexdigest()}.npz"
+
+    @staticmethod
+    def _load_cached_panel(cache_filename, fields):
+        # An unreadable cache file (e.g. left truncated by a crash) is a cache miss
+        try:
+            with np.load(cache_filename, allow_pickle=False) as cached:
+                return cached['dates'], {field: cached[f"field_{i}"] for i, field in enumerate(fields)}
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.info(f"Ignoring unreadable panel cache '{cache_filename}': {e}")
+            return None
+
+    @staticmethod
+    def _save_cached_panel(cache_filename, all_dates, matrices, fields) -> None:
+        # Written next to its final path and renamed, so readers never see a partial file
+        cache_path = os.path.dirname(cache_filename)
+        os.makedirs(cache_path, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=cache_path, suffix=".npz.tmp", delete=False) as f:
+            temporary_filename = f.name
+            try:
+                np.savez(f, dates=all_dates, **{f"field_{i}": matrices[field] for i, field in enumerate(fields)})
+            except BaseException:
+                f.close()
+                os.remove(temporary_filename)
+                raise
+        os.replace(temporary_filename, cache_filename)
+
+    @staticmethod
+    def _build_panel(frames: list, tickers: list, fields: list, start, end) -> dict:
+        dates_per_ticker, values_per_ticker = [], []
+        for data in frames:
+            dates = _to_naive_dates(data['Date']) if len(data) else np.array([], dtype='datetime64[ns]')
+            mask = np.ones(len(dates), dtype=bool)
+            if start is not None:
+                mask &= dates >= _to_naive_bound(start)
+            if end is not None:
+                mask &= dates <= _to_naive_bound(end)
+            order = np.argsort(dates[mask], kind='stable')
+            sorted_dates = dates[mask][order]
+            # A date repeated in the file keeps its last (newest) row
+            keep = np.append(sorted_dates[1:] != sorted_dates[:-1], True) if len(sorted_dates) else np.array([], dtype=bool)
+            dates_per_ticker.append(sorted_dates[keep])
+            values_per_ticker.append({field: pd.to_numeric(data[field], errors='coerce').to_numpy(dtype=float)[mask][order][keep]
+                                      for field in fields if field in data.columns})
+
+        all_dates = np.unique(np.concatenate(dates_per_ticker)) if dates_per_ticker else np.array([], dtype='datetime64[ns]')
+        matrices = {field: np.full((len(all_dates), len(tickers)), np.nan) for field in fields}
+        for column, (dates, values) in enumerate(zip(dates_per_ticker, values_per_ticker)):
+            rows = np.searchsorted(all_dates, dates)
+            for field, field_values in values.items():
+                matrices[field][rows, column] = field_values
+        return all_dates, matrices
+
+    def read_panel(self, tickers: list, ticker_group: str, start=None, end=None, fields: list=PANEL_FIELDS, max_workers: int=16, cache_path: str=None, refresh_cache: bool=False) -> dict:
+        """Read the newest curated file of several tickers into aligned wide
+        matrices (dates as rows, tickers as columns), one per field. Files are
+        read in parallel and, if cache_path is given, the result is cached on
+        disk keyed by the query, the data source and the newest curated file
+        of every ticker, so a new curation invalidates it.
+        :return: dict of field name to float DataFrame backed by a single 2D array
+        """
+        tickers, fields = list(tickers), list(fields)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            newest_files = list(executor.map(lambda ticker: self._panel_files(ticker, ticker_group)[-1:], tickers))
+            cache_filename = None
+            if cache_path is not None:
+                cache_filename = self._panel_cache_filename(cache_path, tickers, ticker_group, start, end, fields, newest_files)
+
+            cached_panel = None
+            if cache_filename is not None and not refresh_cache:
+                cached_panel = self._load_cached_panel(cache_filename, fields)
+
+            if cached_panel is not None:
+                all_dates, matrices = cached_panel
+            else:
+                frames = list(executor.map(self._read_panel_ticker, newest_files))
+                all_dates, matrices = self._build_panel(frames, tickers, fields, start, end)
+                if cache_filename is not None:
+                    self._save_cached_panel(cache_filename, all_dates, matrices, fields)
+
+        index = pd.DatetimeIndex(all_dates, name='Date')
+        return {field: pd.DataFrame(matrices[field], index=index, columns=tickers) for field in fields}
+
+
 #####################################################################
 # On-Premise File Readers
 #####################################################################
 
-class DataReader(ABC):
+class DataReader(PanelReaderMixin, ABC):
 
-    def __init__(self, ingestion_path: str, curation_path: str='', only_newest_ingestion: bool=False) -> None:
+    def __init__(self, ingestion_path: str, curation_path: str='', only_newest_ingestion: bool=False, adjust_for_actions: bool=False) -> None:
         self.ingestion_path = ingestion_path
         self.curation_path = curation_path
         self.only_newest_ingestion = only_newest_ingestion
+        self.adjust_for_actions = adjust_for_actions
         # self.ingested_file_type = ingested_file_type
         # self.curated_file_type = curated_file_type
         # self.selected_file_extensions = []
@@ -25,9 +181,8 @@ class DataReader(ABC):
         return True if self.curation_path != '' else False
 
     def get_filepaths_from_layer(self, layer_path, selected_file_extensions, ticker, ticker_group):
-        tickers_in_layer = os.listdir(f"{layer_path}/{ticker_group}")
         tickers_full_paths = []
-        if ticker in tickers_in_layer:
+        if os.path.isdir(f"{layer_path}/{ticker_group}/{ticker}"):
             file_names = os.listdir(f"{layer_path}/{ticker_group}/{ticker}")
             file_names.sort()
             BASE_DIR = os.getcwd()
@@ -39,6 +194,20 @@ class DataReader(ABC):
     def read_curation_files(self) -> None:
         pass
 
+    def _panel_source(self) -> list:
+        return [self.__class__.__name__, self.curation_path, self.selected_file_extensions]
+
+    def _panel_files(self, ticker: str, ticker_group: str) -> list:
+        if not self.use_curated_data:
+            return []
+        return self.get_filepaths_from_layer(layer_path=self.curation_path, selected_file_extensions=self.selected_file_extensions, ticker=ticker, ticker_group=ticker_group)
+
+    def _panel_file_version(self, path: str) -> str:
+        return f"{path}@{os.path.getmtime(path)}"
+
+    def _read_panel_file(self, path: str) -> pd.DataFrame:
+        return self.read_curation_files([path])
+
     def read_ingestion_files(self, path_list, read_only_newest: bool=False) -> list[pd.DataFrame]:
         current_df = pd.DataFrame(columns=['Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits', "Ticker"])
 
@@ -61,14 +230,16 @@ class DataReader(ABC):
         else:
             curated_filepaths = []
         current_df = self.read_curation_files(curated_filepaths)
+        if self.adjust_for_actions:
+            current_df = adjust_prices(current_df)
         return current_df
 
 
 
 class CsvReader(DataReader):
 
-    def __init__(self, ingestion_path: str, curation_path: str = '', only_newest_ingestion: bool = False) -> None:
-        super().__init__(ingestion_path, curation_path, only_newest_ingestion)
+    def __init__(self, ingestion_path: str, curation_path: str = '', only_newest_ingestion: bool = False, adjust_for_actions: bool = False) -> None:
+        super().__init__(ingestion_path, curation_path, only_newest_ingestion, adjust_for_actions)
         self.selected_file_extensions = ['csv']
 
     def read_curation_files(self, path_list) -> list[pd.DataFrame]:
@@ -81,8 +252,8 @@ class CsvReader(DataReader):
 
 class ParquetReader(DataReader):
 
-    def __init__(self, ingestion_path: str, curation_path: str = '', only_newest_ingestion: bool = False) -> None:
-        super().__init__(ingestion_path, curation_path, only_newest_ingestion)
+    def __init__(self, ingestion_path: str, curation_path: str = '', only_newest_ingestion: bool = False, adjust_for_actions: bool = False) -> None:
+        super().__init__(ingestion_path, curation_path, only_newest_ingestion, adjust_for_actions)
         self.selected_file_extensions = ['parquet']
     
     def read_curation_files(self, path_list) -> list[pd.DataFrame]:
@@ -95,8 +266,8 @@ class ParquetReader(DataReader):
 
 class SqliteReader(DataReader):
 
-    def __init__(self, ingestion_path: str, curation_path: str = '', only_newest_ingestion: bool = False) -> None:
-        super().__init__(ingestion_path, curation_path, only_newest_ingestion)
+    def __init__(self, ingestion_path: str, curation_path: str = '', only_newest_ingestion: bool = False, adjust_for_actions: bool = False) -> None:
+        super().__init__(ingestion_path, curation_path, only_newest_ingestion, adjust_for_actions)
         self.selected_file_extensions = ['db']
     
     def read_curation_files(self, path_list) -> list[pd.DataFrame]:
@@ -114,12 +285,13 @@ class SqliteReader(DataReader):
 # Cloud Object Readers
 #####################################################################
 
-class FileS3Reader(S3BaseClass):
+class FileS3Reader(S3BaseClass, PanelReaderMixin):
     
-    def __init__(self, client, raw_bucket_name, curated_bucket_name) -> None:
+    def __init__(self, client, raw_bucket_name, curated_bucket_name, adjust_for_actions: bool=False) -> None:
         super().__init__(client, bucket_name='')
         self.raw_bucket_name = raw_bucket_name
         self.curated_bucket_name = curated_bucket_name
+        self.adjust_for_actions = adjust_for_actions
 
     def read_ingested_files(self, all_path_list, read_only_newest: bool=False) -> list[pd.DataFrame]:
         current_df = [pd.DataFrame(columns=['Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits', "Ticker"])]
@@ -141,10 +313,36 @@ class FileS3Reader(S3BaseClass):
         current_df = [pd.DataFrame(columns=['Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits', "Ticker"])]
         filtered_paths = [path for path in all_path_list if path.split('.')[-1] == self.object_extension]
         if len(filtered_paths) != 0:
-            path_list = filtered_paths[-1] if read_only_newest else filtered_paths
+            path_list = filtered_paths[-1:] if read_only_newest else filtered_paths
             current_df = [self._read(f"s3://{self.bucket_name}/{path}") for path in path_list]
         return current_df
 
+    def _panel_source(self) -> list:
+        return [self.__class__.__name__, self.curated_bucket_name, self.object_extension]
+
+    def _panel_files(self, ticker: str, ticker_group: str) -> list:
+        if not self._curated_bucket_exists:
+            return []
+        response = self.client.list_objects_v2(Bucket=self.curated_bucket_name, Prefix=f"{ticker_group}/{ticker}/")
+        contents = [content for content in response.get("Contents", []) if content['Key'].split('.')[-1] == self.object_extension]
+        # Curated objects may be overwritten under the same key, so the ETag and
+        # modification time listed with each key identify its version
+        for content in contents:
+            self._panel_versions[content['Key']] = f"{content['Key']}@{content.get('ETag')}@{content.get('LastModified')}"
+        return [content['Key'] for content in contents]
+
+    def _panel_file_version(self, path: str) -> str:
+        return self._panel_versions[path]
+
+    def _read_panel_file(self, path: str) -> pd.DataFrame:
+        return self._read(f"s3://{self.curated_bucket_name}/{path}")
+
+    def read_panel(self, tickers: list, ticker_group: str, *args, **kwargs) -> dict:
+        self.bucket_name = self.curated_bucket_name
+        self._curated_bucket_exists = self.check_if_bucket_exists()
+        self._panel_versions = {}
+        return super().read_panel(tickers, ticker_group, *args, **kwargs)
+
     def read_ingested_layer(self, ticker: str, ticker_group: str) -> list[pd.DataFrame]:
         self.bucket_name = self.raw_bucket_name
         ingested_data = [pd.DataFrame(columns=['Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits', "Ticker"])]
@@ -161,13 +359,15 @@ class FileS3Reader(S3BaseClass):
         if bucket_exists:
             curated_object_keys = self.get_object_keys_from_bucket(ticker, ticker_group)
             curated_data = self.read_curated_files(curated_object_keys)
+        if self.adjust_for_actions:
+            curated_data = [adjust_prices(data) for data in curated_data]
         return curated_data
 
 
 class CsvS3Reader(FileS3Reader):
 
-    def __init__(self, client, raw_bucket_name, curated_bucket_name) -> None:
-        super().__init__(client, raw_bucket_name, curated_bucket_name)
+    def __init__(self, client, raw_bucket_name, curated_bucket_name, adjust_for_actions: bool=False) -> None:
+        super().__init__(client, raw_bucket_name, curated_bucket_name, adjust_for_actions)
         self.object_extension = 'csv'
 
     def _read(self, path) -> list[pd.DataFrame]:
@@ -176,8 +376,8 @@ class CsvS3Reader(FileS3Reader):
 
 class ParquetS3Reader(FileS3Reader):
 
-    def __init__(self, client, raw_bucket_name, curated_bucket_name) -> None:
-        super().__init__(client, raw_bucket_name, curated_bucket_name)
+    def __init__(self, client, raw_bucket_name, curated_bucket_name, adjust_for_actions: bool=False) -> None:
+        super().__init__(client, raw_bucket_name, curated_bucket_name, adjust_for_actions)
         self.object_extension = 'parquet'
 
     def _read(self, path) -> list[pd.DataFrame]:
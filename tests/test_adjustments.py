@@ -0,0 +1,54 @@
+from pathlib import Path
+import sys
+path = str(Path(Path(__file__).parent.absolute()).parent.absolute())
+sys.path.insert(0, path)
+
+import os
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+
+import pandas as pd
+import pytest
+
+from adjustments import adjust_prices, remove_split_adjustment
+
+
+@pytest.fixture
+def raw_prices_fixture():
+    return pd.DataFrame({
+        'Date': ['2020-01-01', '2020-01-02', '2020-01-03', '2020-01-04'],
+        'Open': [100.0, 102.0, 51.0, 50.0],
+        'High': [101.0, 104.0, 52.0, 51.0],
+        'Low': [99.0, 100.0, 50.0, 48.0],
+        'Close': [100.0, 102.0, 51.0, 50.0],
+        'Volume': [10, 10, 20, 20],
+        'Dividends': [0.0, 0.0, 0.0, 0.5],
+        'Stock Splits': [0.0, 0.0, 2.0, 0.0],
+        'Ticker': ['FOO'] * 4,
+    })
+
+
+def test_adjust_prices_splits_only(raw_prices_fixture):
+    actual = adjust_prices(raw_prices_fixture, dividends=False)
+    assert actual['Close'].tolist() == [50.0, 51.0, 51.0, 50.0]
+    assert actual['Volume'].tolist() == [20, 20, 20, 20]
+
+
+def test_adjust_prices_with_dividends(raw_prices_fixture):
+    actual = adjust_prices(raw_prices_fixture)
+    dividend_factor = 1 - 0.5 / 51.0
+    expected = [50.0 * dividend_factor, 51.0 * dividend_factor, 51.0 * dividend_factor, 50.0]
+    assert actual['Close'].tolist() == pytest.approx(expected)
+
+
+def test_remove_split_adjustment_roundtrip(raw_prices_fixture):
+    split_adjusted = adjust_prices(raw_prices_fixture, dividends=False)
+    actual = remove_split_adjustment(split_adjusted)
+    assert actual['Close'].tolist() == pytest.approx(raw_prices_fixture['Close'].tolist())
+    assert actual['Volume'].tolist() == pytest.approx(raw_prices_fixture['Volume'].tolist())
+
+
+def test_adjust_prices_by_ticker(raw_prices_fixture):
+    other = raw_prices_fixture.assign(Ticker='BAR', **{'Stock Splits': 0.0})
+    actual = adjust_prices(pd.concat([raw_prices_fixture, other]), dividends=False)
+    assert actual[actual['Ticker'] == 'BAR']['Close'].tolist() == [100.0, 102.0, 51.0, 50.0]
+    assert actual[actual['Ticker'] == 'FOO']['Close'].tolist() == [50.0, 51.0, 51.0, 50.0]
@@ -0,0 +1,222 @@
+from pathlib import Path
+import sys
+path = str(Path(Path(__file__).parent.absolute()).parent.absolute())
+sys.path.insert(0, path)
+
+import os
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+
+import io
+import itertools
+import multiprocessing
+
+import pytest
+from botocore.exceptions import ClientError
+
+from coordination import S3LeaseStore, SqliteLeaseStore
+
+
+TICKERS = [f"T{i:03d}" for i in range(40)]
+CURRENT_DATE = "2024-01-02"
+
+
+def claim_until_exhausted(database_path, worker_id, queue):
+    store = SqliteLeaseStore(database_path)
+    claimed = []
+    while True:
+        lease = store.claim(worker_id, TICKERS, lease_seconds=60, current_date=CURRENT_DATE)
+        if lease is None:
+            break
+        claimed.append(lease[0])
+        store.release(worker_id, lease[0], CURRENT_DATE)
+    queue.put(claimed)
+
+
+@pytest.fixture
+def lease_store_fixture(tmp_path):
+    store = SqliteLeaseStore(str(tmp_path / "leases.db"))
+    store.register(TICKERS)
+    return store
+
+
+def test_claim_skips_leased_and_ingested_tickers(lease_store_fixture):
+    first = lease_store_fixture.claim("worker-a", ["AAA", *TICKERS[:2]], lease_seconds=60, current_date=CURRENT_DATE)
+    lease_store_fixture.release("worker-a", first[0], CURRENT_DATE)
+    second = lease_store_fixture.claim("worker-b", TICKERS[:2], lease_seconds=60, current_date=CURRENT_DATE)
+    third = lease_store_fixture.claim("worker-c", TICKERS[:2], lease_seconds=60, current_date=CURRENT_DATE)
+    assert first == (TICKERS[0], None)
+    assert second == (TICKERS[1], None)
+    assert third is None
+
+
+def test_expired_lease_is_reclaimed(lease_store_fixture):
+    lease_store_fixture.claim("worker-a", TICKERS[:1], lease_seconds=-1, current_date=CURRENT_DATE)
+    actual = lease_store_fixture.claim("worker-b", TICKERS[:1], lease_seconds=60, current_date=CURRENT_DATE)
+    assert actual == (TICKERS[0], None)
+    assert lease_store_fixture.renew("worker-a", TICKERS[:1], lease_seconds=60) == []
+    assert lease_store_fixture.renew("worker-b", TICKERS[:1], lease_seconds=60) == TICKERS[:1]
+
+
+def test_reset_clears_checkpoints(lease_store_fixture):
+    lease_store_fixture.release("worker-a", TICKERS[0], "2024-01-05")
+    lease_store_fixture.release("worker-a", TICKERS[1], "2024-01-05")
+    lease_store_fixture.reset(TICKERS[:1])
+    assert lease_store_fixture.get_checkpoints()[TICKERS[0]] is None
+    assert lease_store_fixture.get_checkpoints()[TICKERS[1]] == "2024-01-05"
+    assert lease_store_fixture.claim("worker-a", TICKERS[:2], lease_seconds=60, current_date="2024-01-05") == (TICKERS[0], None)
+
+
+def test_release_merges_checkpoints(lease_store_fixture):
+    lease_store_fixture.release("worker-a", TICKERS[0], "2024-01-05")
+    lease_store_fixture.release("worker-b", TICKERS[0], "2024-01-03")
+    assert lease_store_fixture.get_checkpoints()[TICKERS[0]] == "2024-01-05"
+
+
+def test_concurrent_workers_claim_each_ticker_once(lease_store_fixture):
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=claim_until_exhausted, args=(lease_store_fixture.database_path, f"worker-{i}", queue))
+               for i in range(4)]
+    for worker in workers:
+        worker.start()
+    claimed = [ticker for _ in workers for ticker in queue.get(timeout=60)]
+    for worker in workers:
+        worker.join()
+    assert sorted(claimed) == TICKERS
+    assert set(lease_store_fixture.get_checkpoints().values()) == {CURRENT_DATE}
+
+
+#####################################################################
+# S3LeaseStore with an in-memory client
+#####################################################################
+
+class FakeS3Client():
+
+    def __init__(self):
+        self.buckets = set()
+        self.objects = {}
+        self.etags = itertools.count()
+        self.forced_conflicts = 0
+        self.before_put = None
+        self.calls = {"create_bucket": 0, "get_object": 0, "put_object": 0}
+
+    def list_buckets(self):
+        return {"Buckets": [{"Name": name} for name in self.buckets]}
+
+    def create_bucket(self, Bucket):
+        self.calls["create_bucket"] += 1
+        self.buckets.add(Bucket)
+
+    def get_object(self, Bucket, Key):
+        self.calls["get_object"] += 1
+        body, etag = self.objects[(Bucket, Key)]
+        return {"Body": io.BytesIO(body.encode()), "ETag": etag}
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None):
+        self.calls["put_object"] += 1
+        if self.before_put is not None:
+            before_put, self.before_put = self.before_put, None
+            before_put()
+        current = self.objects.get((Bucket, Key))
+        failed = (IfNoneMatch == "*" and current is not None) or (IfMatch is not None and (current is None or current[1] != IfMatch))
+        if self.forced_conflicts > 0 and not failed:
+            self.forced_conflicts -= 1
+            failed = True
+        if failed:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject")
+        self.objects[(Bucket, Key)] = (Body, f'"{next(self.etags)}"')
+
+    def get_paginator(self, name):
+        client = self
+
+        class Paginator():
+            def paginate(self, Bucket, Prefix):
+                keys = [key for bucket, key in client.objects if bucket == Bucket and key.startswith(Prefix)]
+                return [{"Contents": [{"Key": key} for key in keys]}]
+        return Paginator()
+
+
+@pytest.fixture
+def s3_client_fixture():
+    return FakeS3Client()
+
+
+@pytest.fixture
+def s3_lease_store_fixture(s3_client_fixture):
+    store = S3LeaseStore(s3_client_fixture, "leases-bucket")
+    store.register(TICKERS[:5])
+    return store
+
+
+def test_s3_store_creates_bucket_only_when_missing(s3_client_fixture):
+    S3LeaseStore(s3_client_fixture, "leases-bucket")
+    S3LeaseStore(s3_client_fixture, "leases-bucket")
+    assert s3_client_fixture.calls["create_bucket"] == 1
+
+
+def test_s3_register_keeps_existing_leases(s3_lease_store_fixture):
+    s3_lease_store_fixture.release("worker-a", TICKERS[0], CURRENT_DATE)
+    s3_lease_store_fixture.register(TICKERS[:5])
+    assert s3_lease_store_fixture.get_checkpoints()[TICKERS[0]] == CURRENT_DATE
+
+
+def test_s3_workers_claim_distinct_tickers(s3_client_fixture, s3_lease_store_fixture):
+    other_store = S3LeaseStore(s3_client_fixture, "leases-bucket")
+    claimed = []
+    for store, worker_id in itertools.islice(itertools.cycle([(s3_lease_store_fixture, "worker-a"), (other_store, "worker-b")]), 6):
+        lease = store.claim(worker_id, TICKERS[:5], lease_seconds=60, current_date=CURRENT_DATE)
+        if lease is not None:
+            claimed.append(lease[0])
+    assert sorted(claimed) == TICKERS[:5]
+
+
+def test_s3_claim_moves_on_after_losing_a_conditional_write(s3_client_fixture, s3_lease_store_fixture):
+    s3_client_fixture.forced_conflicts = 1
+    actual = s3_lease_store_fixture.claim("worker-a", TICKERS[:2], lease_seconds=60, current_date=CURRENT_DATE)
+    assert actual is not None
+    assert s3_lease_store_fixture.claim("worker-a", TICKERS[:2], lease_seconds=60, current_date=CURRENT_DATE) is None
+
+
+def test_s3_expired_lease_is_reclaimed(s3_client_fixture, s3_lease_store_fixture):
+    s3_lease_store_fixture.claim("worker-a", TICKERS[:1], lease_seconds=-1, current_date=CURRENT_DATE)
+    other_store = S3LeaseStore(s3_client_fixture, "leases-bucket")
+    assert other_store.claim("worker-b", TICKERS[:1], lease_seconds=60, current_date=CURRENT_DATE) == (TICKERS[0], None)
+    assert s3_lease_store_fixture.renew("worker-a", TICKERS[:1], lease_seconds=60) == []
+    assert other_store.renew("worker-b", TICKERS[:1], lease_seconds=60) == TICKERS[:1]
+
+
+def test_s3_release_retries_and_merges_checkpoints(s3_client_fixture, s3_lease_store_fixture):
+    s3_lease_store_fixture.claim("worker-a", TICKERS[:1], lease_seconds=60, current_date=CURRENT_DATE)
+    s3_lease_store_fixture.release("worker-b", TICKERS[0], "2024-01-05")
+    s3_client_fixture.forced_conflicts = 2
+    s3_lease_store_fixture.release("worker-a", TICKERS[0], "2024-01-03")
+    lease, _ = s3_lease_store_fixture._get_lease(TICKERS[0])
+    assert lease == {"owner": None, "expires_at": None, "checkpoint": "2024-01-05"}
+
+
+def test_s3_draining_costs_linear_requests(s3_client_fixture, s3_lease_store_fixture):
+    gets_before = s3_client_fixture.calls["get_object"]
+    while True:
+        lease = s3_lease_store_fixture.claim("worker-a", TICKERS[:5], lease_seconds=60, current_date=CURRENT_DATE)
+        if lease is None:
+            break
+        s3_lease_store_fixture.release("worker-a", lease[0], CURRENT_DATE)
+    # One GET per claim and one per release
+    assert s3_client_fixture.calls["get_object"] - gets_before == 2 * 5
+
+
+def test_s3_interleaved_renewals_keep_the_lease(s3_client_fixture, s3_lease_store_fixture):
+    s3_lease_store_fixture.claim("worker-a", TICKERS[:1], lease_seconds=60, current_date=CURRENT_DATE)
+    heartbeat_renewals = []
+    # The heartbeat renews between the GET and the conditional PUT of the pre-write renewal
+    s3_client_fixture.before_put = lambda: heartbeat_renewals.append(s3_lease_store_fixture.renew("worker-a", TICKERS[:1], lease_seconds=60))
+    assert s3_lease_store_fixture.renew("worker-a", TICKERS[:1], lease_seconds=60) == TICKERS[:1]
+    assert heartbeat_renewals == [TICKERS[:1]]
+
+
+def test_s3_reset_clears_checkpoints(s3_lease_store_fixture):
+    lease = s3_lease_store_fixture.claim("worker-a", TICKERS[:1], lease_seconds=60, current_date=CURRENT_DATE)
+    s3_lease_store_fixture.release("worker-a", lease[0], CURRENT_DATE)
+    assert s3_lease_store_fixture.claim("worker-a", TICKERS[:1], lease_seconds=60, current_date=CURRENT_DATE) is None
+    s3_lease_store_fixture.reset(TICKERS[:1])
+    assert s3_lease_store_fixture.get_checkpoints()[TICKERS[0]] is None
+    assert s3_lease_store_fixture.claim("worker-a", TICKERS[:1], lease_seconds=60, current_date=CURRENT_DATE) == (TICKERS[0], None)
@@ -0,0 +1,50 @@
+from pathlib import Path
+import sys
+path = str(Path(Path(__file__).parent.absolute()).parent.absolute())
+sys.path.insert(0, path)
+
+import os
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+import writers
+
+with patch.object(writers, "DataWriter", create=True), patch.object(writers, "S3Writer", create=True):
+    from ingestors import TickerDataIngestor
+
+
+TICKERS = ["AAA", "BBB"]
+
+
+@pytest.fixture
+def checkpoint_dir_fixture(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("checkpoints")
+    with open("checkpoints/TickerDataIngestor.checkpoint", "w") as f:
+        json.dump({"AAA": "2024-01-02", "BBB": None}, f)
+
+
+def build_ingestor(**kwargs):
+    return TickerDataIngestor(writer=None, ticker=TICKERS, batch_ingest=False, interval="1d", **kwargs)
+
+
+def test_legacy_checkpoint_is_reset_for_raw_prices(checkpoint_dir_fixture):
+    ingestor = build_ingestor()
+    assert ingestor._checkpoint == {"AAA": None, "BBB": None}
+
+
+def test_legacy_checkpoint_is_kept_for_adjusted_prices(checkpoint_dir_fixture):
+    ingestor = build_ingestor(auto_adjust=True)
+    assert ingestor._checkpoint == {"AAA": "2024-01-02", "BBB": None}
+
+
+def test_mode_is_recorded_with_the_checkpoint(checkpoint_dir_fixture):
+    build_ingestor()._update_checkpoint("AAA", "2024-01-03")
+    with open("checkpoints/TickerDataIngestor.mode") as f:
+        assert json.load(f) == {"mode": "raw"}
+    assert build_ingestor()._checkpoint == {"AAA": "2024-01-03", "BBB": None}
+    assert build_ingestor(auto_adjust=True)._checkpoint == {"AAA": None, "BBB": None}
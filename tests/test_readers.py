@@ -0,0 +1,128 @@
+from pathlib import Path
+import sys
+path = str(Path(Path(__file__).parent.absolute()).parent.absolute())
+sys.path.insert(0, path)
+
+import os
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+
+import warnings
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+with patch.dict(sys.modules, {"models": MagicMock()}):
+    from readers import CsvReader, CsvS3Reader, FileS3Reader
+
+
+def write_curated(curation_path, ticker, dates, closes, name=None):
+    ticker_path = f"{curation_path}/NASDAQ/{ticker}"
+    os.makedirs(ticker_path, exist_ok=True)
+    pd.DataFrame({'Date': dates, 'Close': closes, 'Volume': [1] * len(dates), 'Ticker': ticker})\
+        .to_csv(f"{ticker_path}/{name or ticker}.csv", index=False)
+
+
+@pytest.fixture
+def curated_layer_fixture(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # AAA crosses the US daylight saving change of 2024-03-10, BBB trades on a different calendar
+    write_curated("cur", "AAA", ['2024-03-08 00:00:00-05:00', '2024-03-11 00:00:00-04:00'], [1.0, 2.0])
+    write_curated("cur", "BBB", ['2024-03-11 00:00:00-04:00', '2024-03-12 00:00:00-04:00'], [5.0, 6.0])
+    return CsvReader("ing", "cur")
+
+
+def test_read_panel_aligns_tickers(curated_layer_fixture):
+    actual = curated_layer_fixture.read_panel(["AAA", "BBB"], "NASDAQ", fields=['Close'])['Close']
+    assert list(actual.index) == list(pd.to_datetime(['2024-03-08', '2024-03-11', '2024-03-12']))
+    np.testing.assert_array_equal(actual.to_numpy(), [[1.0, np.nan], [2.0, 5.0], [np.nan, 6.0]])
+
+
+def test_read_panel_absent_ticker_is_nan(curated_layer_fixture):
+    actual = curated_layer_fixture.read_panel(["AAA", "ZZZ"], "NASDAQ", fields=['Close', 'Volume'])
+    assert list(actual['Close'].columns) == ["AAA", "ZZZ"]
+    assert actual['Close']['ZZZ'].isna().all()
+    assert actual['Volume']['ZZZ'].isna().all()
+
+
+def test_read_panel_date_range(curated_layer_fixture):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        actual = curated_layer_fixture.read_panel(["AAA", "BBB"], "NASDAQ", start=pd.Timestamp('2024-03-11', tz='America/New_York'),
+                                                  end='2024-03-11', fields=['Close'])['Close']
+    assert list(actual.index) == [pd.Timestamp('2024-03-11')]
+    assert actual.iloc[0].tolist() == [2.0, 5.0]
+
+
+def test_read_panel_keeps_newest_duplicate_date(curated_layer_fixture):
+    write_curated("cur", "CCC", ['2024-03-11 00:00:00-04:00', '2024-03-11 00:00:00-04:00'], [7.0, 8.0])
+    actual = curated_layer_fixture.read_panel(["CCC"], "NASDAQ", fields=['Close'])['Close']
+    assert actual['CCC'].tolist() == [8.0]
+
+
+def test_read_panel_cache(curated_layer_fixture):
+    with patch.object(CsvReader, "_read_panel_file", autospec=True, side_effect=CsvReader._read_panel_file) as read_file:
+        first = curated_layer_fixture.read_panel(["AAA", "BBB"], "NASDAQ", fields=['Close'], cache_path="cache")
+        second = curated_layer_fixture.read_panel(["AAA", "BBB"], "NASDAQ", fields=['Close'], cache_path="cache")
+        assert read_file.call_count == 2
+        assert second['Close'].equals(first['Close'])
+
+        # Another curation path is another source
+        write_curated("cur2", "AAA", ['2024-03-08 00:00:00-05:00'], [9.0])
+        other = CsvReader("ing", "cur2").read_panel(["AAA", "BBB"], "NASDAQ", fields=['Close'], cache_path="cache")
+        assert read_file.call_count == 3
+        assert other['Close']['AAA'].tolist() == [9.0]
+
+        # A newer curated file invalidates the cached panel
+        write_curated("cur", "AAA", ['2024-03-08 00:00:00-05:00'], [3.0], name="AAB")
+        newest = curated_layer_fixture.read_panel(["AAA", "BBB"], "NASDAQ", fields=['Close'], cache_path="cache")
+        assert read_file.call_count == 5
+        assert newest['Close']['AAA'].dropna().tolist() == [3.0]
+
+
+def test_read_panel_truncated_cache_is_a_miss(curated_layer_fixture):
+    first = curated_layer_fixture.read_panel(["AAA", "BBB"], "NASDAQ", fields=['Close'], cache_path="cache")
+    cache_filename, = os.listdir("cache")
+    with open(f"cache/{cache_filename}", "r+b") as f:
+        f.truncate(10)
+    second = curated_layer_fixture.read_panel(["AAA", "BBB"], "NASDAQ", fields=['Close'], cache_path="cache")
+    assert second['Close'].equals(first['Close'])
+    assert os.listdir("cache") == [cache_filename]
+    assert curated_layer_fixture._load_cached_panel(f"cache/{cache_filename}", ['Close']) is not None
+
+
+@pytest.fixture
+def s3_reader_fixture():
+    client = MagicMock()
+    client.list_buckets.return_value = {"Buckets": [{"Name": "curated"}]}
+    client.list_objects_v2.return_value = {"KeyCount": 2, "Contents": [
+        {"Key": "NASDAQ/AAA/2024-01-01 00:00:00.csv", "ETag": '"1"', "LastModified": "2024-01-01"},
+        {"Key": "NASDAQ/AAA/2024-01-02 00:00:00.csv", "ETag": '"2"', "LastModified": "2024-01-02"}]}
+    return CsvS3Reader(client, "raw", "curated")
+
+
+def test_s3_read_panel_reads_only_newest_object(s3_reader_fixture):
+    newest = pd.DataFrame({'Date': ['2024-01-02'], 'Close': [2.0]})
+    with patch.object(CsvS3Reader, "_read", return_value=newest) as read_object:
+        actual = s3_reader_fixture.read_panel(["AAA"], "NASDAQ", fields=['Close'])['Close']
+    read_object.assert_called_once_with("s3://curated/NASDAQ/AAA/2024-01-02 00:00:00.csv")
+    assert actual['AAA'].tolist() == [2.0]
+
+
+def test_s3_read_panel_overwritten_object_invalidates_cache(s3_reader_fixture, tmp_path):
+    cache_path = str(tmp_path / "cache")
+    newest = pd.DataFrame({'Date': ['2024-01-02'], 'Close': [2.0]})
+    with patch.object(CsvS3Reader, "_read", return_value=newest) as read_object:
+        s3_reader_fixture.read_panel(["AAA"], "NASDAQ", fields=['Close'], cache_path=cache_path)
+        s3_reader_fixture.read_panel(["AAA"], "NASDAQ", fields=['Close'], cache_path=cache_path)
+        assert read_object.call_count == 1
+        # Same key uploaded again
+        s3_reader_fixture.client.list_objects_v2.return_value["Contents"][-1]["ETag"] = '"3"'
+        s3_reader_fixture.read_panel(["AAA"], "NASDAQ", fields=['Close'], cache_path=cache_path)
+        assert read_object.call_count == 2
+
+
+def test_s3_reader_without_read_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        FileS3Reader(MagicMock(), "raw", "curated")
@@ -0,0 +1,134 @@
+from pathlib import Path
+import sys
+path = str(Path(Path(__file__).parent.absolute()).parent.absolute())
+sys.path.insert(0, path)
+
+import os
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+
+import datetime
+import sqlite3
+import threading
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+
+import writers
+from coordination import SqliteLeaseStore
+
+with patch.object(writers, "DataWriter", create=True), patch.object(writers, "S3Writer", create=True):
+    from ingestors import ShardedTickerDataIngestor
+
+
+TICKERS = ["AAA", "BBB", "CCC"]
+
+
+class FakeWriter():
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.written = []
+        self.batches = []
+
+    def write(self, data, ticker, ticker_group):
+        if ticker == self.fail_on:
+            raise RuntimeError(f"failed writing {ticker}")
+        self.written.append(ticker)
+
+    def batch_write(self, batch_data, ticker, ticker_group):
+        self.batches.append(sorted(data['Ticker'].iloc[0] for data in batch_data))
+
+
+def fake_history(**kwargs):
+    return pd.DataFrame({'Open': [1.0], 'High': [1.0], 'Low': [1.0], 'Close': [1.0], 'Volume': [1],
+                         'Dividends': [0.0], 'Stock Splits': [0.0]}, index=pd.Index(['2024-01-02'], name='Date'))
+
+
+@pytest.fixture
+def lease_store_fixture(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return SqliteLeaseStore(str(tmp_path / "leases.db"))
+
+
+@pytest.fixture(autouse=True)
+def fake_yfinance_fixture():
+    api = MagicMock()
+    api.history.side_effect = fake_history
+    with patch("ingestors.yf.Ticker", return_value=api), patch("ingestors.time.sleep"):
+        yield api
+
+
+def build_ingestor(lease_store, writer, worker_id="worker-a", **kwargs):
+    return ShardedTickerDataIngestor(writer=writer, ticker=TICKERS, batch_ingest=kwargs.pop("batch_ingest", False),
+                                     interval="1d", lease_store=lease_store, worker_id=worker_id, **kwargs)
+
+
+def today():
+    return datetime.date.today().strftime("%Y-%m-%d")
+
+
+def test_ingest_writes_each_ticker_once_across_workers(lease_store_fixture):
+    first_writer, second_writer = FakeWriter(), FakeWriter()
+    build_ingestor(lease_store_fixture, first_writer).ingest()
+    build_ingestor(lease_store_fixture, second_writer, worker_id="worker-b").ingest()
+    assert sorted(first_writer.written) == TICKERS
+    assert second_writer.written == []
+    assert lease_store_fixture.get_checkpoints() == {tick: today() for tick in TICKERS}
+    assert not os.path.exists("checkpoints")
+
+
+def test_ingest_releases_leases_on_error(lease_store_fixture):
+    ingestor = build_ingestor(lease_store_fixture, FakeWriter(fail_on="BBB"))
+    with pytest.raises(RuntimeError):
+        ingestor.ingest()
+    assert ingestor._held_leases == set()
+    assert lease_store_fixture.get_checkpoints() == {"AAA": today(), "BBB": None, "CCC": None}
+    assert lease_store_fixture.claim("worker-b", ["BBB"], lease_seconds=60, current_date=today()) == ("BBB", None)
+
+
+def test_batch_ingest_writes_once_and_checkpoints(lease_store_fixture):
+    writer = FakeWriter()
+    build_ingestor(lease_store_fixture, writer, batch_ingest=True).ingest()
+    assert writer.batches == [TICKERS]
+    assert lease_store_fixture.get_checkpoints() == {tick: today() for tick in TICKERS}
+
+
+def test_lost_lease_is_not_written_nor_checkpointed(lease_store_fixture, fake_yfinance_fixture):
+    def steal_lease(**kwargs):
+        # Another worker reclaimed the lease while it was expired
+        conn = sqlite3.connect(lease_store_fixture.database_path)
+        conn.execute("UPDATE leases SET owner = 'thief' WHERE ticker = 'AAA'")
+        conn.commit()
+        conn.close()
+        return fake_history(**kwargs)
+    fake_yfinance_fixture.history.side_effect = steal_lease
+    writer = FakeWriter()
+    build_ingestor(lease_store_fixture, writer).ingest()
+    assert "AAA" not in writer.written
+    assert lease_store_fixture.get_checkpoints()["AAA"] is None
+
+
+def test_heartbeat_keeps_lease_alive(lease_store_fixture, fake_yfinance_fixture):
+    lease_seconds = 0.3
+    steals = []
+    def slow_history(**kwargs):
+        # time.sleep is patched out for get_data, so the fetch is slowed down with an Event
+        threading.Event().wait(3 * lease_seconds)
+        steals.append(lease_store_fixture.claim("thief", ["AAA"], lease_seconds=60, current_date=today()))
+        return fake_history(**kwargs)
+    fake_yfinance_fixture.history.side_effect = slow_history
+    ingestor = build_ingestor(lease_store_fixture, FakeWriter(), lease_seconds=lease_seconds)
+    ingestor.ticker = ["AAA"]
+    ingestor.ingest()
+    assert steals == [None]
+
+
+def test_reset_checkpoint_refetches_entire_history(lease_store_fixture, fake_yfinance_fixture):
+    build_ingestor(lease_store_fixture, FakeWriter()).ingest()
+    ingestor = build_ingestor(lease_store_fixture, FakeWriter())
+    ingestor.reset_checkpoint()
+    assert lease_store_fixture.get_checkpoints() == {tick: None for tick in TICKERS}
+    fake_yfinance_fixture.history.reset_mock()
+    ingestor.ingest()
+    assert [call.kwargs.get("period") for call in fake_yfinance_fixture.history.call_args_list] == ["max"] * len(TICKERS)